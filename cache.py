@@ -0,0 +1,252 @@
+# cache.py
+"""
+TTL cache for upstream API responses: in-process dict in front of SQLite in pipeline_cache/,
+or in front of Redis when REDIS_URL is set (shared across processes and hosts).
+Values are stored as msgpack (never pickle), so a shared cache can't inject code.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from functools import cache
+from pathlib import Path
+from typing import Any
+
+import msgspec
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Price history and macro context are refreshed at most hourly; news is volatile so it expires sooner
+PRICES_TTL = 3600
+MACRO_TTL = 3600
+NEWS_TTL = 15 * 60
+
+# Seconds to wait on Redis before treating it as down (the client's default is to wait forever)
+REDIS_TIMEOUT = 2.0
+# Seconds to stay on SQLite after a failed Redis call before trying Redis again
+REDIS_RETRY_AFTER = 60.0
+
+# Namespace for every key, so entries don't collide with other apps on a shared Redis
+_KEY_PREFIX = "nebula"
+
+# In-process front tier: {key: (expires_at, encoded value)}, oldest entries evicted first past the limit.
+# Holding the encoded bytes means every hit decodes a fresh copy that callers may mutate.
+_MEMORY_MAXSIZE = 512
+_memory: dict[str, tuple[float, bytes]] = {}
+_memory_lock = threading.Lock()  # fetch_stock_data may be called from several threads
+
+
+@cache
+def _get_cache_dir() -> Path:
+    """Return cache directory; create if missing. Resolved once per process (cache_clear() to reset)."""
+    path = Path(os.getenv("PIPELINE_CACHE_DIR", "pipeline_cache"))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+@cache
+def _db_path() -> Path:
+    """Path of the cache database; its table and expiry index are created once per process."""
+    path = _get_cache_dir() / "api_cache.sqlite3"
+    with closing(sqlite3.connect(path, timeout=30)) as conn, conn:
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value BLOB NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+    return path
+
+
+def _connect() -> sqlite3.Connection:
+    """Open a connection to the cache database (one per batch; safe across threads)."""
+    return sqlite3.connect(_db_path(), timeout=30)
+
+
+def _to_builtin(obj: Any) -> Any:
+    """msgpack fallback for numpy values (e.g. price closes); they come back as plain lists/floats."""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not cacheable")
+
+
+_ENCODER = msgspec.msgpack.Encoder(enc_hook=_to_builtin)
+_DECODER = msgspec.msgpack.Decoder()
+
+# time.monotonic() until which Redis is skipped, set by a failed Redis call
+_redis_down_until = 0.0
+
+
+@cache
+def _redis_client() -> Any | None:
+    """Redis client if REDIS_URL is set (redis is only imported then), else None."""
+    url = os.getenv("REDIS_URL")
+    if not url:
+        return None
+    try:
+        import redis
+    except ImportError:
+        logger.warning("REDIS_URL is set but redis is not installed (pip install redis); using the SQLite cache")
+        return None
+    return redis.Redis.from_url(url, socket_timeout=REDIS_TIMEOUT, socket_connect_timeout=REDIS_TIMEOUT)
+
+
+def _redis() -> Any | None:
+    """Redis client to use, or None for SQLite (REDIS_URL unset, or Redis failed in the last REDIS_RETRY_AFTER s)."""
+    return None if time.monotonic() < _redis_down_until else _redis_client()
+
+
+def _mark_redis_down(e: Exception) -> None:
+    """Skip Redis for REDIS_RETRY_AFTER seconds after a failed call (timeouts included)."""
+    global _redis_down_until
+    now = time.monotonic()
+    if now >= _redis_down_until:
+        logger.warning("Redis cache unavailable (%s); using the SQLite cache for %.0fs", e, REDIS_RETRY_AFTER)
+    _redis_down_until = now + REDIS_RETRY_AFTER
+
+
+def _decode(raw: bytes) -> Any | None:
+    """Decode a stored value; None for unreadable entries (e.g. rows written by older versions)."""
+    try:
+        return _DECODER.decode(raw)
+    except msgspec.DecodeError:
+        return None
+
+
+def cache_key(kind: str, *parts: Any) -> str:
+    """Build a cache key like 'nebula:prices:NVDA:30:2025022314' (UTC date-hour bucket)."""
+    hour = time.strftime("%Y%m%d%H", time.gmtime())
+    return ":".join([_KEY_PREFIX, kind, *(str(p) for p in parts), hour])
+
+
+def _remember(key: str, expires_at: float, raw: bytes) -> None:
+    """Put an encoded entry in the in-process tier, evicting the oldest ones past _MEMORY_MAXSIZE."""
+    with _memory_lock:
+        _memory.pop(key, None)
+        _memory[key] = (expires_at, raw)
+        while len(_memory) > _MEMORY_MAXSIZE:
+            _memory.pop(next(iter(_memory)))
+
+
+# SQLite's default limit on bound parameters is 999 on older builds
+_SQLITE_CHUNK = 500
+
+# The cache is best-effort: a locked database or unwritable cache dir costs a miss, not the fetch
+_SQLITE_ERRORS = (sqlite3.Error, OSError)
+
+
+def cache_get_many(keys: list[str]) -> dict[str, Any]:
+    """
+    Cached values for keys (missing/expired keys are left out); each call returns fresh copies.
+    Memory is checked first; the rest go out in one round-trip (one SQLite connection, or one
+    Redis pipeline). Blocking: call it via asyncio.to_thread from coroutines.
+    """
+    now = time.time()
+    found: dict[str, Any] = {}
+    rest: list[str] = []
+    with _memory_lock:
+        entries = [_memory.get(key) for key in keys]
+    for key, entry in zip(keys, entries, strict=True):
+        value = _decode(entry[1]) if entry is not None and entry[0] >= now else None
+        if value is not None:
+            found[key] = value
+        else:
+            rest.append(key)
+    if not rest:
+        return found
+
+    client = _redis()
+    rows: list[tuple[str, float, bytes]] = []
+    if client is not None:
+        pipe = client.pipeline()
+        for key in rest:
+            pipe.get(key).pttl(key)
+        try:
+            replies = pipe.execute()
+        except Exception as e:  # an unreachable cache is a miss, not a failed fetch
+            _mark_redis_down(e)
+            return found
+        for key, raw, ttl_ms in zip(rest, replies[::2], replies[1::2], strict=True):
+            if raw is not None:
+                rows.append((key, now + max(ttl_ms, 0) / 1000, raw))
+    else:
+        try:
+            with closing(_connect()) as conn:
+                for i in range(0, len(rest), _SQLITE_CHUNK):
+                    chunk = rest[i : i + _SQLITE_CHUNK]
+                    rows += conn.execute(
+                        f"SELECT key, expires_at, value FROM cache WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+        except _SQLITE_ERRORS as e:
+            logger.warning("SQLite cache read failed (%s); treating %d keys as misses", e, len(rest))
+            return found
+
+    for key, expires_at, raw in rows:
+        value = _decode(raw) if expires_at >= now else None
+        if value is not None:
+            found[key] = value
+            _remember(key, expires_at, raw)
+    return found
+
+
+def cache_get(key: str) -> Any | None:
+    """Return the cached value for key, or None if missing or expired. Checks memory before SQLite."""
+    return cache_get_many([key]).get(key)
+
+
+def cache_set_many(items: dict[str, Any], ttl: float) -> None:
+    """
+    Store every value in items for ttl seconds in one transaction (or one Redis pipeline).
+    Expired SQLite rows are purged in the same transaction (Redis expires its own). A failed
+    write is logged and skipped. Blocking.
+    """
+    if not items:
+        return
+    now = time.time()
+    encoded = {key: _ENCODER.encode(value) for key, value in items.items()}
+    for key, raw in encoded.items():
+        _remember(key, now + ttl, raw)
+    client = _redis()
+    if client is not None:
+        pipe = client.pipeline()
+        for key, raw in encoded.items():
+            pipe.set(key, raw, px=int(ttl * 1000))
+        try:
+            pipe.execute()
+            return
+        except Exception as e:  # fall through to SQLite
+            _mark_redis_down(e)
+    try:
+        with closing(_connect()) as conn, conn:
+            conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                [(key, now + ttl, raw) for key, raw in encoded.items()],
+            )
+    except _SQLITE_ERRORS as e:
+        logger.warning("SQLite cache write failed (%s); %d values kept in memory only", e, len(encoded))
+
+
+def cache_set(key: str, value: Any, ttl: float) -> None:
+    """Store value under key for ttl seconds. See cache_set_many."""
+    cache_set_many({key: value}, ttl)
+
+
+def enable_llm_cache() -> None:
+    """
+    Cache LLM completions in SQLite, keyed by the rendered prompt and model params.
+    Reruns over unchanged gathered_data then skip the LLM call entirely. If the cache dir
+    can't be used, LLM calls simply go uncached.
+    """
+    from langchain_community.cache import SQLiteCache
+    from langchain_core.globals import set_llm_cache
+
+    try:
+        set_llm_cache(SQLiteCache(database_path=str(_get_cache_dir() / "llm_cache.sqlite3")))
+    except Exception as e:  # SQLAlchemy wraps sqlite3 errors in its own types
+        logger.warning("LLM cache disabled (%s)", e)
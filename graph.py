@@ -1,13 +1,13 @@
 # graph.py
-"""LangGraph workflow: linear batch pipeline (select -> gather -> analyst -> ranking -> sheets)."""
+"""LangGraph workflow: linear batch pipeline (select -> gather+analyze -> ranking -> sheets)."""
 
 import asyncio
+from functools import cache
 
 from langgraph.graph import END, StateGraph
 
 from nodes import (
-    analyst_node,
-    gather_data_node,
+    gather_and_analyze_node,
     ranking_node,
     select_ticker_node,
     sheets_writer_node,
@@ -15,25 +15,28 @@ from nodes import (
 )
 from state import AgentState
 
+__all__ = ["build_graph", "run_pipeline", "run_pipeline_async"]
 
+
+@cache
 def build_graph():
     """
     Build the compiled LangGraph pipeline.
-    Linear path: select_ticker -> gather_data -> analyst -> write_all_analysis -> ranking -> sheets_writer -> END.
+    Linear path: select_ticker -> gather_and_analyze -> write_all_analysis -> ranking -> sheets_writer -> END.
+    gather_and_analyze streams each ticker from data gathering straight into the LLM.
+    Compiled once per process; the graph holds no per-run state, so repeated runs reuse it.
     """
     workflow = StateGraph(AgentState)
 
     workflow.add_node("select_ticker", select_ticker_node)
-    workflow.add_node("gather_data", gather_data_node)
-    workflow.add_node("analyst", analyst_node)
+    workflow.add_node("gather_and_analyze", gather_and_analyze_node)
     workflow.add_node("write_all_analysis", write_all_analysis_to_sheet_node)
     workflow.add_node("ranking", ranking_node)
     workflow.add_node("sheets_writer", sheets_writer_node)
 
     workflow.set_entry_point("select_ticker")
-    workflow.add_edge("select_ticker", "gather_data")
-    workflow.add_edge("gather_data", "analyst")
-    workflow.add_edge("analyst", "write_all_analysis")
+    workflow.add_edge("select_ticker", "gather_and_analyze")
+    workflow.add_edge("gather_and_analyze", "write_all_analysis")
     workflow.add_edge("write_all_analysis", "ranking")
     workflow.add_edge("ranking", "sheets_writer")
     workflow.add_edge("sheets_writer", END)
@@ -41,17 +44,16 @@ def build_graph():
     return workflow.compile()
 
 
-def run_pipeline(
+async def run_pipeline_async(
     tickers: list[str],
     sheet_id: str = "",
 ) -> dict:
     """
-    Run the full batch pipeline for the given tickers.
-    Uses ainvoke so async nodes (gather_data, analyst) run correctly.
+    Run the full batch pipeline for the given tickers on the caller's event loop.
+    Use this from async code (servers, notebooks); run_pipeline wraps it for sync callers.
     sheet_id: optional Google Sheet ID or title for output.
     Returns final state (including analysis_results, ranked_results).
     """
-    graph = build_graph()
     initial: AgentState = {
         "tickers": tickers,
         "gathered_data": {},
@@ -60,9 +62,16 @@ def run_pipeline(
         "sheet_id": sheet_id,
     }
     config = {"configurable": {}}
+    return await build_graph().ainvoke(initial, config=config)
 
-    async def _run():
-        return await graph.ainvoke(initial, config=config)
 
-    final_state = asyncio.run(_run())
-    return final_state
+def run_pipeline(
+    tickers: list[str],
+    sheet_id: str = "",
+) -> dict:
+    """
+    Run the full batch pipeline for the given tickers (sync wrapper around run_pipeline_async).
+    sheet_id: optional Google Sheet ID or title for output.
+    Returns final state (including analysis_results, ranked_results).
+    """
+    return asyncio.run(run_pipeline_async(tickers, sheet_id))
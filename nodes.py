@@ -1,34 +1,62 @@
 # nodes.py
 """LangGraph node logic: batch data gathering, LLM analysis, ranking, and Google Sheets write."""
 
+import ast
 import asyncio
+import heapq
 import logging
 import os
+import re
+import sys
+from collections.abc import Awaitable, Callable
 from datetime import datetime
+from functools import cache, lru_cache
 from typing import Any
 
+import numpy as np
+import orjson
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
+from openai import APIConnectionError, RateLimitError
 from tenacity import (
-    retry,
+    AsyncRetrying,
     retry_if_exception_type,
     stop_after_attempt,
     wait_exponential,
+    wait_exponential_jitter,
 )
 
+from cache import (
+    MACRO_TTL,
+    NEWS_TTL,
+    PRICES_TTL,
+    cache_get,
+    cache_get_many,
+    cache_key,
+    cache_set,
+    cache_set_many,
+    enable_llm_cache,
+)
 from state import AgentState
 from tools import (
+    TRANSIENT_ERRORS,
     append_results_to_sheet,
-    fetch_stock_data,
-    search_news_and_macro,
+    fetch_stock_data_batch,
+    search_macro_async,
+    search_news_async,
     write_results_to_new_sheet,
 )
 
 logger = logging.getLogger(__name__)
 
+# Identical prompts (unchanged gathered_data on rerun) are answered from the local LLM cache
+enable_llm_cache()
+
 # Max concurrent operations per batch node
 CONCURRENCY_LIMIT = 5
 MAX_RETRIES = 3
+# Errors worth retrying for the LLM call (openai's connection/timeout errors are not OSErrors)
+LLM_TRANSIENT_ERRORS = (ConnectionError, TimeoutError, OSError, APIConnectionError, RateLimitError)
 
 # LLM prompt must include the required analysis instruction (English equivalent)
 ANALYST_SYSTEM = """You are a stock analyst. Based on the given data, output a short prediction.
@@ -60,13 +88,20 @@ def _format_price_summary(data: dict[str, Any]) -> str:
     p = raw.get("prices", raw) if isinstance(raw, dict) else raw
     if not p or not isinstance(p, dict):
         return "No price data available."
+    # closes is a float ndarray from tools (a plain list when loaded from JSON state)
+    closes = p.get("closes")
+    closes = np.asarray(closes if closes is not None else [], dtype=float)
+    high, low = p.get("high_14d"), p.get("low_14d")
+    if closes.size:
+        high = high if high is not None else float(closes[-14:].max())
+        low = low if low is not None else float(closes[-14:].min())
     parts = [
         f"Current: {p.get('current')}",
-        f"14d high: {p.get('high_14d')}",
-        f"14d low: {p.get('low_14d')}",
+        f"14d high: {high}",
+        f"14d low: {low}",
     ]
-    if p.get("closes"):
-        parts.append(f"Recent closes: {p['closes'][-7:]}")
+    if closes.size:
+        parts.append(f"Recent closes: {closes[-7:].tolist()}")
     return "\n".join(parts)
 
 
@@ -82,84 +117,180 @@ def _format_news_macro(data: dict[str, Any]) -> str:
     return "\n".join(lines) if lines else "No news or macro data."
 
 
-@retry(
-    stop=stop_after_attempt(MAX_RETRIES),
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    retry=retry_if_exception_type((ConnectionError, TimeoutError, OSError)),
-    reraise=True,
-)
-def _fetch_one_ticker_sync(ticker: str) -> dict[str, Any]:
+def _has_error_snippet(snippets: list[str]) -> bool:
+    """True if search_news_and_macro returned an error placeholder (e.g. 'Tavily error: ...')."""
+    return any(str(s).split(":", 1)[0].lower().endswith("error") for s in snippets)
+
+
+async def _download_prices(tickers: list[str]) -> dict[str, dict[str, Any]]:
+    """
+    Download price history for tickers in one batched yfinance request (off the event loop).
+    Not retried: yf.download catches per-ticker failures itself, so they come back as "No history".
+    """
+    return await asyncio.to_thread(fetch_stock_data_batch, tickers, 30)
+
+
+async def _fetch_prices_async(tickers: list[str]) -> dict[str, dict[str, Any]]:
     """
-    Fetch price (yfinance) and news/macro (Tavily) for one ticker. Used in thread pool.
-    Raises after MAX_RETRIES for transient errors; caller should catch and skip.
+    Price data for ALL tickers: cached entries first, then one batched download for the misses.
+    A failed download is recorded per ticker as {ticker, error} so analyst_node skips it.
     """
-    gathered: dict[str, Any] = {}
+    # One cache round-trip for the whole batch, off the event loop
+    keys = {ticker: cache_key("prices", ticker, 30) for ticker in tickers}
+    hits = await asyncio.to_thread(cache_get_many, list(keys.values()))
+    prices = {ticker: hits[key] for ticker, key in keys.items() if key in hits}
+    misses = [ticker for ticker in tickers if ticker not in prices]
+    if not misses:
+        return prices
+
     try:
-        price_result = fetch_stock_data.invoke({"ticker": ticker, "days_back": 30})
-        if isinstance(price_result, dict):
-            gathered["prices"] = price_result
-        else:
-            gathered["prices"] = {"ticker": ticker, "error": str(price_result)}
+        downloaded = await _download_prices(misses)
     except Exception as e:
-        gathered["prices"] = {"ticker": ticker, "error": str(e)}
+        logger.exception("Batch price download failed for %d tickers: %s", len(misses), e)
+        downloaded = {t: {"ticker": t, "error": str(e)} for t in misses}
+    fresh: dict[str, Any] = {}
+    for ticker in misses:
+        result = downloaded.get(ticker) or {"ticker": ticker, "error": "No history"}
+        prices[ticker] = result
+        if not result.get("error"):
+            fresh[keys[ticker]] = result
+    await asyncio.to_thread(cache_set_many, fresh, PRICES_TTL)
+    return prices
+
+
+async def _fetch_news_async(ticker: str) -> list[str]:
+    """
+    Fetch news (Tavily) for one ticker. Successful responses are served from the
+    on-disk TTL cache on reruns. Transient network errors are retried (MAX_RETRIES attempts);
+    if they persist, the ticker gets an error placeholder instead of news.
+    """
+    news_key = cache_key("ticker_news", ticker)
+    news = await asyncio.to_thread(cache_get, news_key)
+    if news is not None:
+        return news
+
     try:
-        news_macro = search_news_and_macro(ticker, include_macro=True)
-        gathered["news"] = news_macro.get("news", [])
-        gathered["macro"] = news_macro.get("macro", [])
-        if not gathered["news"] and not gathered["macro"]:
-            logger.warning(f"No news/macro data retrieved for {ticker}")
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(MAX_RETRIES),
+            wait=wait_exponential(multiplier=1, min=2, max=10),
+            retry=retry_if_exception_type(TRANSIENT_ERRORS),
+            reraise=True,
+        ):
+            with attempt:
+                news = await search_news_async(ticker)
+    except TRANSIENT_ERRORS as e:
+        logger.exception(f"Failed to fetch news for {ticker} after retries: {e}")
+        return [f"Error: {e}"]
+
+    if news and not _has_error_snippet(news):
+        await asyncio.to_thread(cache_set, news_key, news, NEWS_TTL)
+    if not news:
+        logger.warning(f"No news data retrieved for {ticker}")
+    return news
+
+
+async def _fetch_macro_async() -> list[str]:
+    """Macro context (Tavily) for the whole batch: one query shared by every ticker, TTL-cached."""
+    try:
+        macro_key = cache_key("macro")
+        macro = await asyncio.to_thread(cache_get, macro_key)
+        if macro is None:
+            macro = await search_macro_async()
+            if macro and not _has_error_snippet(macro):
+                await asyncio.to_thread(cache_set, macro_key, macro, MACRO_TTL)
+        if not macro:
+            logger.warning("No macro data retrieved")
     except Exception as e:
-        logger.exception(f"Failed to fetch news/macro for {ticker}: {e}")
-        gathered["news"] = [f"Error: {e}"]
-        gathered["macro"] = [f"Error: {e}"]
-    return gathered
+        logger.exception(f"Failed to fetch macro data: {e}")
+        macro = [f"Error: {e}"]
+    return macro
+
+
+def _batch_timestamp(state: AgentState) -> str:
+    """Run timestamp from select_ticker_node; staged runs without it fall back to now."""
+    return state.get("batch_timestamp") or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+@lru_cache(maxsize=32)
+def _normalize_tickers(tickers: tuple[str, ...]) -> tuple[str, ...]:
+    """Strip/uppercase tickers and drop blanks (memoized: scheduled reruns reuse the same list)."""
+    return tuple((t or "").strip().upper() for t in tickers if (t or "").strip())
 
 
 def select_ticker_node(state: AgentState) -> dict[str, Any]:
     """
     Batch mode: normalize ticker list and pass through. No popping; tickers stay for gather_data.
+    Also stamps the run once so every result and sheet name in the batch shares one timestamp.
     """
-    tickers = state.get("tickers") or []
-    normalized = [(t or "").strip().upper() for t in tickers if (t or "").strip()]
-    return {"tickers": normalized}
+    normalized = list(_normalize_tickers(tuple(state.get("tickers") or [])))
+    return {"tickers": normalized, "batch_timestamp": _batch_timestamp(state)}
+
+
+async def _run_workers(tickers: list[str], handle: Callable[[str], Awaitable[None]]) -> None:
+    """
+    Run handle(ticker) for every ticker from a queue drained by CONCURRENCY_LIMIT (5) workers,
+    so only that many requests (and coroutines) exist at once regardless of ticker count.
+    """
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+    num_workers = min(CONCURRENCY_LIMIT, len(tickers))
+    for ticker in tickers:
+        queue.put_nowait(ticker)
+    for _ in range(num_workers):
+        queue.put_nowait(None)  # one stop sentinel per worker
+
+    async def worker() -> None:
+        while (ticker := await queue.get()) is not None:
+            await handle(ticker)
+
+    await asyncio.gather(*(worker() for _ in range(num_workers)))
+
+
+async def _gather_one(
+    ticker: str,
+    prices: asyncio.Task[dict[str, dict[str, Any]]],
+    macro: asyncio.Task[list[str]],
+) -> dict[str, Any] | None:
+    """
+    Combine a ticker's news with the batch-wide price and macro tasks. News (Tavily) is fetched
+    while the batched price download (yfinance) is still running. None if the fetch failed.
+    """
+    try:
+        news = await _fetch_news_async(ticker)
+        ticker_prices = (await prices)[ticker]
+    except Exception as e:
+        logger.exception("Gather failed for %s: %s", ticker, e)
+        print(f"  [Skip] {ticker}: gather failed.")
+        return None
+    print(f"  Gathered: {ticker}")
+    return {"prices": ticker_prices, "news": news, "macro": await macro}
 
 
 async def gather_data_node(state: AgentState) -> dict[str, Any]:
     """
-    Fetch data for ALL tickers with max CONCURRENCY_LIMIT (5) at a time.
-    Uses asyncio.gather(return_exceptions=True); failed tickers are logged and skipped.
+    Fetch data for ALL tickers: prices in one batched yfinance download and one shared macro
+    query, overlapped with per-ticker news at max CONCURRENCY_LIMIT (5) at a time.
+    Failed tickers are logged and skipped.
     """
     tickers = state.get("tickers") or []
     if not tickers:
         return {"gathered_data": {}}
 
-    sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
-
-    async def fetch_one(ticker: str) -> tuple[str, Any]:
-        async with sem:
-            try:
-                loop = asyncio.get_event_loop()
-                data = await loop.run_in_executor(None, _fetch_one_ticker_sync, ticker)
-                return (ticker, data)
-            except Exception as e:
-                logger.exception("Gather failed for %s after retries: %s", ticker, e)
-                print(f"  [Skip] {ticker}: gather failed after retries.", flush=True)
-                return (ticker, None)
+    prices = asyncio.create_task(_fetch_prices_async(tickers))
+    macro = asyncio.create_task(_fetch_macro_async())
+    fetched: dict[str, Any] = {}
 
-    results = await asyncio.gather(
-        *[fetch_one(t) for t in tickers],
-        return_exceptions=True,
-    )
-
-    gathered_data: dict[str, Any] = {}
-    for r in results:
-        if isinstance(r, Exception):
-            continue
-        ticker, data = r
+    async def handle(ticker: str) -> None:
+        data = await _gather_one(ticker, prices, macro)
         if data is not None:
-            gathered_data[ticker] = data
-            print(f"  Gathered: {ticker}", flush=True)
+            fetched[ticker] = data
 
+    await _run_workers(tickers, handle)
+    await asyncio.gather(prices, macro)  # already done unless every news fetch failed
+    # Per-ticker progress lines are buffered; flush once per node instead of once per line
+    sys.stdout.flush()
+
+    # Keep input ticker order (workers finish in arbitrary order)
+    gathered_data = {t: fetched[t] for t in tickers if t in fetched}
     return {"gathered_data": gathered_data}
 
 
@@ -192,15 +323,33 @@ def _extract_text_from_llm_response(raw: Any) -> str:
     return str(raw).strip()
 
 
+# Braces only: the scanner jumps between them in C instead of stepping through every character
+_BRACE_RE = re.compile(r"[{}]")
+# 'key': / 'value', -> double-quoted, for LLMs that answer with Python-style dicts
+_SINGLE_QUOTED_RE = re.compile(r"'([^']*)'(\s*[:,\]])")
+
+
+def _find_json_block(s: str) -> str:
+    """Return the first balanced {...} block in s (or the tail from the first '{' if unbalanced)."""
+    start = s.find("{")
+    if start == -1:
+        return s
+    depth = 0
+    for m in _BRACE_RE.finditer(s, start):
+        if m.group() == "{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return s[start : m.end()]
+    return s[start:]
+
+
 def _parse_llm_output(text: str | list, ticker: str, today: str) -> dict[str, Any]:
     """
     Parse and validate LLM JSON into a single result dict for sheets_writer.
     Ensures keys: date, ticker, predicted_change_pct (float), reason (str).
     """
-    import ast
-    import json
-    import re
-
     text = _extract_text_from_llm_response(text)
     if not text:
         return {
@@ -210,31 +359,17 @@ def _parse_llm_output(text: str | list, ticker: str, today: str) -> dict[str, An
             "reason": "Could not parse LLM output (empty).",
         }
 
-    def find_json_block(s: str) -> str:
-        start = s.find("{")
-        if start == -1:
-            return s
-        depth = 0
-        for i in range(start, len(s)):
-            if s[i] == "{":
-                depth += 1
-            elif s[i] == "}":
-                depth -= 1
-                if depth == 0:
-                    return s[start : i + 1]
-        return s[start:]
-
-    block = find_json_block(text)
+    block = _find_json_block(text)
     if "```" in block:
-        block = find_json_block(block.replace("```json", "").replace("```", ""))
+        block = _find_json_block(block.replace("```json", "").replace("```", ""))
 
     try:
-        parsed = json.loads(block)
-    except json.JSONDecodeError:
-        normalized = re.sub(r"'([^']*)'(\s*[:,\]])", r'"\1"\2', block)
+        parsed = orjson.loads(block)
+    except orjson.JSONDecodeError:
+        normalized = _SINGLE_QUOTED_RE.sub(r'"\1"\2', block)
         try:
-            parsed = json.loads(normalized)
-        except json.JSONDecodeError:
+            parsed = orjson.loads(normalized)
+        except orjson.JSONDecodeError:
             try:
                 parsed = ast.literal_eval(block)
             except (ValueError, SyntaxError):
@@ -265,29 +400,34 @@ def _parse_llm_output(text: str | list, ticker: str, today: str) -> dict[str, An
     }
 
 
-@retry(
-    stop=stop_after_attempt(MAX_RETRIES),
-    wait=wait_exponential(multiplier=1, min=2, max=10),
-    retry=retry_if_exception_type((ConnectionError, TimeoutError, OSError)),
-    reraise=True,
-)
-def _analyze_one_ticker_sync(
+async def _analyze_one_ticker_async(
     ticker: str,
     data: dict[str, Any],
     chain: Any,
     today: str,
 ) -> dict[str, Any]:
-    """Run LLM for one ticker (sync). Used in executor or with ainvoke."""
+    """
+    Run LLM for one ticker via ainvoke (awaited on the event loop, no executor thread).
+    Transient errors are retried with jittered exponential backoff (asyncio.sleep, so other
+    tickers keep running); a final failure becomes an 'Analysis error' result.
+    """
     price_summary = _format_price_summary(data)
     news_macro = _format_news_macro(data)
     try:
-        msg = chain.invoke(
-            {
-                "ticker": ticker,
-                "price_summary": price_summary,
-                "news_macro": news_macro,
-            }
-        )
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(MAX_RETRIES),
+            wait=wait_exponential_jitter(initial=1, max=10, jitter=0.5),
+            retry=retry_if_exception_type(LLM_TRANSIENT_ERRORS),
+            reraise=True,
+        ):
+            with attempt:
+                msg = await chain.ainvoke(
+                    {
+                        "ticker": ticker,
+                        "price_summary": price_summary,
+                        "news_macro": news_macro,
+                    }
+                )
         raw = msg.content if hasattr(msg, "content") else msg
         text = _extract_text_from_llm_response(raw)
     except Exception as e:
@@ -302,15 +442,13 @@ def _analyze_one_ticker_sync(
     return _parse_llm_output(text, ticker, today)
 
 
-async def analyst_node(state: AgentState) -> dict[str, Any]:
+@cache
+def _get_chain() -> Any:
     """
-    Run LLM for ALL tickers in parallel (max CONCURRENCY_LIMIT concurrent).
-    Uses asyncio.gather(return_exceptions=True); failed tickers are logged and skipped.
+    Build the analyst prompt | LLM chain once per process and reuse it, so the underlying
+    HTTP client keeps its connection to api.deepseek.com warm across calls and stages.
+    Raises ValueError (not cached) if DEEPSEEK_API_KEY is missing.
     """
-    gathered_data = state.get("gathered_data") or {}
-    if not gathered_data:
-        return {"analysis_results": []}
-
     # Check for API key before creating LLM
     api_key = os.getenv("DEEPSEEK_API_KEY")
     if not api_key:
@@ -333,54 +471,61 @@ async def analyst_node(state: AgentState) -> dict[str, Any]:
             ("human", ANALYST_USER),
         ]
     )
-    chain = prompt | llm
-    today = datetime.now().strftime("%Y-%m-%d")
+    return prompt | llm
+
+
+async def _analyze_and_report(
+    ticker: str,
+    data: dict[str, Any],
+    chain: Any,
+    today: str,
+) -> dict[str, Any] | None:
+    """Analyze one ticker and print its result. None if there is no valid price data to analyze."""
+    # Skip when there is no valid price data so we don't call the LLM with empty input
+    prices = data.get("prices")
+    if isinstance(prices, dict) and prices.get("error"):
+        print(f"  [Skip] {ticker}: No valid price data to analyze.")
+        return None
+
+    try:
+        result = await _analyze_one_ticker_async(ticker, data, chain, today)
+        reason = result.get("reason", "")
+        # Show full error message if there's an error, otherwise truncate for success
+        if result.get("predicted_change_pct", 0) == 0.0 and "Analysis error" in reason:
+            # Show full error message for debugging
+            print(f"  -> {result['ticker']}: {result['predicted_change_pct']}% | {reason}")
+        else:
+            # Truncate only for successful predictions
+            print(f"  -> {result['ticker']}: {result['predicted_change_pct']}% | {reason[:60]}...")
+        return result
+    except Exception as e:
+        logger.exception("Analyze failed for %s after retries: %s", ticker, e)
+        print(f"  [Skip] {ticker}: analysis failed after retries.")
+        return {
+            "date": today,
+            "ticker": ticker,
+            "predicted_change_pct": 0.0,
+            "reason": f"Error: {e}",
+        }
+
+
+async def analyst_node(state: AgentState) -> dict[str, Any]:
+    """
+    Run LLM for ALL tickers in parallel (max CONCURRENCY_LIMIT concurrent).
+    Uses asyncio.gather(return_exceptions=True); failed tickers are logged and skipped.
+    """
+    gathered_data = state.get("gathered_data") or {}
+    if not gathered_data:
+        return {"analysis_results": []}
+
+    chain = _get_chain()
+    today = _batch_timestamp(state)[:10]
 
     sem = asyncio.Semaphore(CONCURRENCY_LIMIT)
-    loop = asyncio.get_event_loop()
 
     async def analyze_one(ticker: str, data: dict[str, Any]) -> dict[str, Any] | None:
         async with sem:
-            # Skip when there is no valid price data so we don't call the LLM with empty input
-            prices = data.get("prices")
-            if isinstance(prices, dict) and prices.get("error"):
-                print(f"  [Skip] {ticker}: No valid price data to analyze.", flush=True)
-                return None
-
-            try:
-                result = await loop.run_in_executor(
-                    None,
-                    lambda t=ticker, d=data: _analyze_one_ticker_sync(
-                        t, d, chain, today
-                    ),
-                )
-                reason = result.get("reason", "")
-                # Show full error message if there's an error, otherwise truncate for success
-                if (
-                    result.get("predicted_change_pct", 0) == 0.0
-                    and "Analysis error" in reason
-                ):
-                    # Show full error message for debugging
-                    print(
-                        f"  -> {result['ticker']}: {result['predicted_change_pct']}% | {reason}",
-                        flush=True,
-                    )
-                else:
-                    # Truncate only for successful predictions
-                    print(
-                        f"  -> {result['ticker']}: {result['predicted_change_pct']}% | {reason[:60]}...",
-                        flush=True,
-                    )
-                return result
-            except Exception as e:
-                logger.exception("Analyze failed for %s after retries: %s", ticker, e)
-                print(f"  [Skip] {ticker}: analysis failed after retries.", flush=True)
-                return {
-                    "date": today,
-                    "ticker": ticker,
-                    "predicted_change_pct": 0.0,
-                    "reason": f"Error: {e}",
-                }
+            return await _analyze_and_report(ticker, data, chain, today)
 
     results = await asyncio.gather(
         *[analyze_one(ticker, data) for ticker, data in gathered_data.items()],
@@ -394,21 +539,59 @@ async def analyst_node(state: AgentState) -> dict[str, Any]:
         if isinstance(r, dict):
             analysis_results.append(r)
 
+    sys.stdout.flush()
     return {"analysis_results": analysis_results}
 
 
+async def gather_and_analyze_node(state: AgentState) -> dict[str, Any]:
+    """
+    Streamed gather + analyze for ALL tickers (full pipeline). Each worker hands its ticker
+    to the LLM as soon as the data is ready, so analysis overlaps with gathering the rest.
+    Per-ticker behavior matches gather_data_node followed by analyst_node (used by the stages).
+    """
+    tickers = list(dict.fromkeys(state.get("tickers") or []))
+    if not tickers:
+        return {"gathered_data": {}, "analysis_results": []}
+
+    chain = _get_chain()
+    today = _batch_timestamp(state)[:10]
+    prices = asyncio.create_task(_fetch_prices_async(tickers))
+    macro = asyncio.create_task(_fetch_macro_async())
+    fetched: dict[str, Any] = {}
+    analyzed: dict[str, dict[str, Any]] = {}
+
+    async def handle(ticker: str) -> None:
+        data = await _gather_one(ticker, prices, macro)
+        if data is None:
+            return
+        fetched[ticker] = data
+        result = await _analyze_and_report(ticker, data, chain, today)
+        if result is not None:
+            analyzed[ticker] = result
+
+    await _run_workers(tickers, handle)
+    await asyncio.gather(prices, macro)  # already done unless every news fetch failed
+    sys.stdout.flush()
+
+    # Keep input ticker order (workers finish in arbitrary order)
+    return {
+        "gathered_data": {t: fetched[t] for t in tickers if t in fetched},
+        "analysis_results": [analyzed[t] for t in tickers if t in analyzed],
+    }
+
+
 TOP_N = 5
 
 
 def ranking_node(state: AgentState) -> dict[str, Any]:
     """
-    Filter to positive predicted_change_pct, sort descending, take top TOP_N.
+    Filter to positive predicted_change_pct, take top TOP_N in descending order.
+    heapq.nlargest is O(n log TOP_N) and never materializes a fully sorted list.
     If fewer than 5 positive, write whatever is available.
     """
     results = state.get("analysis_results") or []
     positive = [r for r in results if (r.get("predicted_change_pct") or 0) > 0]
-    positive.sort(key=lambda r: r.get("predicted_change_pct", 0), reverse=True)
-    ranked = positive[:TOP_N]
+    ranked = heapq.nlargest(TOP_N, positive, key=lambda r: r.get("predicted_change_pct", 0))
     print(
         f"  Ranked {len(ranked)} positive predictions (top 5 written to sheet).",
         flush=True,
@@ -421,8 +604,6 @@ def write_all_analysis_to_sheet_node(state: AgentState) -> dict[str, Any]:
     Write ALL analysis results to a new Google Sheet (before ranking).
     Creates a new sheet with timestamp name if sheet_name not provided in state.
     """
-    from datetime import datetime
-
     analysis_results = state.get("analysis_results") or []
     if not analysis_results:
         return {}
@@ -430,7 +611,7 @@ def write_all_analysis_to_sheet_node(state: AgentState) -> dict[str, Any]:
     # Get sheet name from state or use timestamp
     sheet_name = state.get("analysis_sheet_name")
     if not sheet_name:
-        sheet_name = f"Stock Analysis {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+        sheet_name = f"Stock Analysis {_batch_timestamp(state)}"
 
     try:
         sheet_id = write_results_to_new_sheet(sheet_name, analysis_results)
@@ -450,8 +631,6 @@ def sheets_writer_node(state: AgentState) -> dict[str, Any]:
     """
     Write ranked top 5 (or fewer) results to Google Sheet in one operation.
     """
-    import os
-
     ranked = state.get("ranked_results") or []
     if not ranked:
         return {}
@@ -1,7 +1,8 @@
 # pipeline_stages.py
-"""Run pipeline stages separately with persisted state (read/write JSON in pipeline_state/)."""
+"""Run pipeline stages separately with persisted state (read/write Parquet/msgpack in pipeline_state/)."""
 
 import asyncio
+from datetime import datetime
 from typing import Any
 
 from nodes import (
@@ -14,18 +15,27 @@ from nodes import (
 from state import AgentState
 from state_io import (
     load_analysis_results,
-    load_gathered_data,
+    load_gathered_data_async,
     load_ranked_results,
-    save_analysis_results,
-    save_gathered_data,
+    save_analysis_results_async,
+    save_gathered_data_async,
     save_ranked_results,
 )
 from tools import write_results_to_new_sheet
 
+__all__ = [
+    "run_stage_gather",
+    "run_stage_gather_async",
+    "run_stage_analyze",
+    "run_stage_analyze_async",
+    "run_stage_rank",
+    "run_stage_sheets",
+]
 
-def run_stage_gather(tickers: list[str]) -> dict[str, Any]:
+
+async def run_stage_gather_async(tickers: list[str]) -> dict[str, Any]:
     """
-    Stage 1: Normalize tickers, run gather_data_node once for all tickers. Save gathered_data.json.
+    Stage 1: Normalize tickers, run gather_data_node once for all tickers. Save gathered_data.parquet.
     Returns final state (gathered_data key).
     """
     state: AgentState = {
@@ -37,22 +47,27 @@ def run_stage_gather(tickers: list[str]) -> dict[str, Any]:
     }
     update = select_ticker_node(state)
     state = {**state, **update}
-    update = asyncio.run(gather_data_node(state))
+    update = await gather_data_node(state)
     state = {**state, **update}
-    out_path = save_gathered_data(state.get("gathered_data") or {})
+    out_path = await save_gathered_data_async(state.get("gathered_data") or {})
     print(f"  Saved gathered_data to {out_path}", flush=True)
     return state
 
 
-def run_stage_analyze(
+def run_stage_gather(tickers: list[str]) -> dict[str, Any]:
+    """Stage 1 for sync callers (CLI): runs run_stage_gather_async in a new event loop."""
+    return asyncio.run(run_stage_gather_async(tickers))
+
+
+async def run_stage_analyze_async(
     create_new_sheet: bool = False, sheet_name: str | None = None
 ) -> list[dict[str, Any]]:
     """
-    Stage 2: Load gathered_data.json, run analyst_node once for all tickers, save analysis_results.json.
+    Stage 2: Load gathered_data.parquet, run analyst_node once for all tickers, save analysis_results.
     If create_new_sheet is True, writes all analysis results to a new Google Sheet.
     Returns analysis_results list.
     """
-    gathered_data = load_gathered_data()
+    gathered_data = await load_gathered_data_async()
     if not gathered_data:
         print("  No gathered data to analyze.", flush=True)
         return []
@@ -63,16 +78,14 @@ def run_stage_analyze(
         "ranked_results": [],
         "sheet_id": "",
     }
-    update = asyncio.run(analyst_node(state))
+    update = await analyst_node(state)
     analysis_results = update.get("analysis_results") or []
-    out_path = save_analysis_results(analysis_results)
+    out_path = await save_analysis_results_async(analysis_results)
     print(f"  Saved analysis_results to {out_path}", flush=True)
 
     # Write to new sheet if requested
     if create_new_sheet and analysis_results:
         if sheet_name is None:
-            from datetime import datetime
-
             sheet_name = (
                 f"Stock Analysis {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
             )
@@ -87,9 +100,16 @@ def run_stage_analyze(
     return analysis_results
 
 
+def run_stage_analyze(
+    create_new_sheet: bool = False, sheet_name: str | None = None
+) -> list[dict[str, Any]]:
+    """Stage 2 for sync callers (CLI): runs run_stage_analyze_async in a new event loop."""
+    return asyncio.run(run_stage_analyze_async(create_new_sheet=create_new_sheet, sheet_name=sheet_name))
+
+
 def run_stage_rank() -> list[dict[str, Any]]:
     """
-    Stage 3: Load analysis_results.json, run ranking_node, save ranked_results.json.
+    Stage 3: Load analysis_results, run ranking_node, save ranked_results.
     Returns ranked_results list.
     """
     analysis_results = load_analysis_results()
@@ -103,7 +123,7 @@ def run_stage_rank() -> list[dict[str, Any]]:
 
 def run_stage_sheets(sheet_id: str) -> None:
     """
-    Stage 4: Load ranked_results.json, run sheets_writer_node.
+    Stage 4: Load ranked_results, run sheets_writer_node.
     """
     ranked = load_ranked_results()
     if not ranked:
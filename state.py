@@ -19,3 +19,5 @@ class AgentState(TypedDict, total=False):
     sheet_id: str
     # Optional name for the analysis results sheet (created after analysis stage)
     analysis_sheet_name: str
+    # Run timestamp ("%Y-%m-%d %H:%M:%S") set once by select_ticker; result dates and sheet names use it
+    batch_timestamp: str
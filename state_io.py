@@ -1,86 +1,316 @@
 # state_io.py
-"""Persist pipeline state between stages (JSON in pipeline_state/)."""
+"""Persist pipeline state between stages (Parquet/msgpack in pipeline_state/)."""
 
-import json
+import asyncio
+import mmap
 import os
+import uuid
+from collections.abc import Callable
 from datetime import datetime
+from functools import cache
 from pathlib import Path
 from typing import Any
 
+import msgspec
+import numpy as np
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Numpy arrays/scalars (e.g. price closes) and datetimes serialize natively; _default_serializer covers the rest
+_JSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC
+_JSONL_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NAIVE_UTC | orjson.OPT_APPEND_NEWLINE
+
+# gathered_data on disk: one row per ticker, price stats and news flattened into typed columns
+_PRICE_FIELDS = ("current", "high_14d", "low_14d", "volume_avg", "last_dates", "closes")
+_GATHERED_SCHEMA = pa.schema(
+    [
+        ("ticker", pa.string()),
+        ("price_error", pa.string()),
+        ("current", pa.float64()),
+        ("high_14d", pa.float64()),
+        ("low_14d", pa.float64()),
+        ("volume_avg", pa.float64()),
+        ("last_dates", pa.list_(pa.string())),
+        ("closes", pa.list_(pa.float64())),
+        ("sector", pa.string()),
+        ("industry", pa.string()),
+        ("market_cap", pa.int64()),
+        ("news", pa.list_(pa.string())),
+        ("macro", pa.list_(pa.string())),
+    ]
+)
+
+
+def _leaf_path(name: str) -> str:
+    """Parquet column path of a _GATHERED_SCHEMA field: list values live under '<name>.list.element'."""
+    return f"{name}.list.element" if pa.types.is_list(_GATHERED_SCHEMA.field(name).type) else name
+
+
+# Float columns are byte-shuffled before zstd (like blosc's shuffle): similar prices share their high bytes.
+# Encoding options take leaf paths; a bare list column name (e.g. "closes") would silently match nothing.
+_FLOAT_FIELDS = ("current", "high_14d", "low_14d", "volume_avg", "closes")
+_FLOAT_COLUMNS = [_leaf_path(name) for name in _FLOAT_FIELDS]
+_DICT_COLUMNS = [_leaf_path(name) for name in _GATHERED_SCHEMA.names if name not in _FLOAT_FIELDS]
+
+
+_NUMPY_ARRAY = (np.ndarray,)
+_NUMPY_SCALAR = (np.generic,)
+
 
 def _default_serializer(obj: Any) -> Any:
-    """Convert non-JSON-serializable values for state persistence."""
-    if hasattr(obj, "item") and callable(getattr(obj, "item", None)):  # numpy scalar
-        return obj.item()
-    if hasattr(obj, "tolist") and callable(getattr(obj, "tolist", None)):  # numpy array
+    """Convert values orjson/msgspec can't serialize natively (odd ndarrays, scalar wrappers, datetime subclasses)."""
+    # numpy is the common case: plain isinstance checks before the duck-typed fallbacks
+    if isinstance(obj, _NUMPY_ARRAY):
         return obj.tolist()
-    if isinstance(obj, (datetime,)):
+    if isinstance(obj, _NUMPY_SCALAR):
+        return obj.item()
+    # orjson/msgspec only take exact datetimes; subclasses such as pd.Timestamp land here
+    if isinstance(obj, datetime):
         return obj.isoformat()
+    # tolist() first: ndarrays also have item(), which fails for size > 1
+    if hasattr(obj, "tolist") and callable(getattr(obj, "tolist", None)):
+        return obj.tolist()
+    if hasattr(obj, "item") and callable(getattr(obj, "item", None)):
+        return obj.item()
     raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
 
+# analysis/ranked results default to msgpack; numpy values go through the same fallback as JSON
+_MSGPACK_ENCODER = msgspec.msgpack.Encoder(enc_hook=_default_serializer)
+_MSGPACK_DECODER = msgspec.msgpack.Decoder(list[dict[str, Any]])
+_MSGPACK_ARRAY32 = b"\xdd"  # msgpack array header with a 4-byte big-endian length
+
+
+@cache
 def _get_state_dir() -> Path:
-    """Return pipeline state directory; create if missing."""
+    """Return pipeline state directory; create if missing. Resolved once per process (cache_clear() to reset)."""
     path = Path(os.getenv("PIPELINE_STATE_DIR", "pipeline_state"))
     path.mkdir(parents=True, exist_ok=True)
     return path
 
 
+def _read_mapped(file_path: Path, decode: Callable[[Any], Any]) -> Any:
+    """Decode file_path straight from the page cache via mmap, without copying it into a bytes object."""
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return decode(b"")  # mmap can't map an empty file; let the decoder raise its usual error
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            return decode(view)
+
+
+def _gathered_to_rows(gathered_data: dict[str, Any]) -> list[dict[str, Any]]:
+    """Flatten {ticker: {prices, news, macro}} into one _GATHERED_SCHEMA row per ticker."""
+    rows = []
+    for ticker, data in gathered_data.items():
+        raw = data.get("prices") or {}
+        prices = raw.get("prices") or {}
+        info = raw.get("info") or {}
+        market_cap = info.get("marketCap")
+        rows.append(
+            {
+                "ticker": ticker,
+                "price_error": str(raw["error"]) if raw.get("error") else None,
+                **{field: prices.get(field) for field in _PRICE_FIELDS},
+                "sector": info.get("sector"),
+                "industry": info.get("industry"),
+                "market_cap": int(market_cap) if market_cap is not None else None,
+                "news": list(data.get("news") or []),
+                "macro": list(data.get("macro") or []),
+            }
+        )
+    return rows
+
+
+def _rows_to_gathered(rows: list[dict[str, Any]]) -> dict[str, Any]:
+    """Rebuild the legacy {ticker: {prices, news, macro}} dict consumed by the nodes."""
+    gathered_data: dict[str, Any] = {}
+    for row in rows:
+        ticker = row["ticker"]
+        if row["price_error"]:
+            prices = {"ticker": ticker, "error": row["price_error"], "prices": None, "info": {}}
+        else:
+            prices = {
+                "ticker": ticker,
+                "prices": {field: row[field] for field in _PRICE_FIELDS},
+                "info": {"sector": row["sector"], "industry": row["industry"], "marketCap": row["market_cap"]},
+            }
+        gathered_data[ticker] = {"prices": prices, "news": row["news"] or [], "macro": row["macro"] or []}
+    return gathered_data
+
+
 def save_gathered_data(gathered_data: dict[str, Any], path: str | Path | None = None) -> Path:
-    """Save gathered_data to JSON. Returns path used."""
+    """Save gathered_data as a columnar Parquet table (byte-stream-split floats, zstd). Returns path used."""
     dir_path = _get_state_dir()
-    file_path = path or dir_path / "gathered_data.json"
+    file_path = path or dir_path / "gathered_data.parquet"
     file_path = Path(file_path)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(gathered_data, f, default=_default_serializer, indent=2, ensure_ascii=False)
+    table = pa.Table.from_pylist(_gathered_to_rows(gathered_data), schema=_GATHERED_SCHEMA)
+    pq.write_table(
+        table,
+        file_path,
+        compression="zstd",
+        use_dictionary=_DICT_COLUMNS,
+        use_byte_stream_split=_FLOAT_COLUMNS,
+    )
     return file_path
 
 
 def load_gathered_data(path: str | Path | None = None) -> dict[str, Any]:
-    """Load gathered_data from JSON."""
-    file_path = path or _get_state_dir() / "gathered_data.json"
-    file_path = Path(file_path)
+    """Load gathered_data from Parquet (or a legacy gathered_data.json) as {ticker: {prices, news, macro}}."""
+    if path is None:
+        dir_path = _get_state_dir()
+        path = dir_path / "gathered_data.parquet"
+        if not path.is_file() and (dir_path / "gathered_data.json").is_file():
+            path = dir_path / "gathered_data.json"
+    file_path = Path(path)
     if not file_path.is_file():
         raise FileNotFoundError(f"State file not found: {file_path}. Run stage 'gather' first.")
-    with open(file_path, encoding="utf-8") as f:
-        return json.load(f)
+    if file_path.suffix == ".json":
+        return _read_mapped(file_path, orjson.loads)
+    return _rows_to_gathered(pq.read_table(file_path, memory_map=True).to_pylist())
+
+
+_STATE_EXTS = (".msgpack.zst", ".msgpack", ".jsonl", ".json")
+
+
+def _state_file(name: str) -> Path:
+    """Default path for a results file in the configured format (PIPELINE_STATE_FORMAT=json|msgpack)."""
+    ext = ".jsonl" if os.getenv("PIPELINE_STATE_FORMAT", "msgpack").lower() == "json" else ".msgpack.zst"
+    return _get_state_dir() / f"{name}{ext}"
+
+
+def _find_state_file(name: str) -> Path:
+    """Existing results file for name: configured format first, then the others (e.g. legacy .json)."""
+    preferred = _state_file(name)
+    if not preferred.is_file():
+        for ext in _STATE_EXTS:
+            candidate = preferred.parent / f"{name}{ext}"
+            if candidate.is_file():
+                return candidate
+    return preferred
+
+
+def _remove_stale_state_files(name: str, keep: Path) -> None:
+    """Delete name's results files in other formats, so _find_state_file can't pick up an older run."""
+    for ext in _STATE_EXTS:
+        sibling = keep.parent / f"{name}{ext}"
+        if sibling != keep:
+            sibling.unlink(missing_ok=True)
+
+
+def _record_format(file_path: Path) -> str:
+    """Encoding suffix of a results file, looking past a trailing .zst (e.g. .msgpack.zst -> .msgpack)."""
+    return Path(file_path.stem).suffix if file_path.suffix == ".zst" else file_path.suffix
+
+
+def _open_for_write(file_path: Path) -> Any:
+    """Binary writer for file_path; .zst paths compress on the fly with Arrow's zstd codec."""
+    if file_path.suffix == ".zst":
+        return pa.CompressedOutputStream(str(file_path), "zstd")
+    return open(file_path, "wb")
+
+
+def _dump_records(records: list[dict[str, Any]], file_path: Path) -> None:
+    """
+    Write records one at a time, so only a single encoded record is held in memory:
+    .jsonl -> one JSON object per line; otherwise a msgpack array (header, then each record).
+    An explicit .json path still gets a single indented JSON array. A trailing .zst adds zstd.
+    """
+    fmt = _record_format(file_path)
+    # Encode into a temp file beside the target and swap it in, so a failed write keeps the previous file
+    tmp_path = file_path.with_name(f".{file_path.name}.{uuid.uuid4().hex}{file_path.suffix}")
+    try:
+        _write_records(records, tmp_path, fmt)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+
+def _write_records(records: list[dict[str, Any]], file_path: Path, fmt: str) -> None:
+    """Encode records into file_path in the given format (see _dump_records)."""
+    with _open_for_write(file_path) as f:
+        if fmt == ".json":
+            f.write(orjson.dumps(records, default=_default_serializer, option=_JSON_OPTIONS))
+        elif fmt == ".jsonl":
+            for record in records:
+                f.write(orjson.dumps(record, default=_default_serializer, option=_JSONL_OPTIONS))
+        else:
+            f.write(_MSGPACK_ARRAY32 + len(records).to_bytes(4, "big"))
+            buf = bytearray()
+            for record in records:
+                _MSGPACK_ENCODER.encode_into(record, buf)
+                f.write(buf)
+
+
+def _decode_records(data: Any, fmt: str) -> list[dict[str, Any]]:
+    """Decode a whole results payload (bytes-like) in the given format; a .jsonl holding an array is legacy JSON."""
+    if fmt == ".jsonl" and bytes(data[:1]) != b"[":
+        return [orjson.loads(line) for line in bytes(data).splitlines() if line.strip()]
+    if fmt in (".json", ".jsonl"):
+        return orjson.loads(data)
+    return _MSGPACK_DECODER.decode(data)
+
+
+def _load_records(file_path: Path) -> list[dict[str, Any]]:
+    """Read records written by _dump_records (format chosen by suffix)."""
+    fmt = _record_format(file_path)
+    if file_path.suffix == ".zst":
+        with pa.input_stream(str(file_path), compression="zstd") as f:
+            return _decode_records(memoryview(f.read_buffer()), fmt)
+    if fmt == ".jsonl":
+        # Plain JSONL is parsed line by line instead of mapping the whole file
+        with open(file_path, "rb") as f:
+            if f.read(1) != b"[":
+                f.seek(0)
+                return [orjson.loads(line) for line in f if line.strip()]
+    return _read_mapped(file_path, lambda view: _decode_records(view, fmt))
+
+
+async def save_gathered_data_async(gathered_data: dict[str, Any], path: str | Path | None = None) -> Path:
+    """save_gathered_data on a worker thread, so async stages don't block the event loop."""
+    return await asyncio.to_thread(save_gathered_data, gathered_data, path)
+
+
+async def load_gathered_data_async(path: str | Path | None = None) -> dict[str, Any]:
+    """load_gathered_data on a worker thread, so async stages don't block the event loop."""
+    return await asyncio.to_thread(load_gathered_data, path)
 
 
 def save_analysis_results(analysis_results: list[dict[str, Any]], path: str | Path | None = None) -> Path:
-    """Save analysis_results to JSON. Returns path used."""
-    dir_path = _get_state_dir()
-    file_path = path or dir_path / "analysis_results.json"
-    file_path = Path(file_path)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(analysis_results, f, default=_default_serializer, indent=2, ensure_ascii=False)
+    """Stream analysis_results to zstd msgpack (or JSONL with PIPELINE_STATE_FORMAT=json). Returns path used."""
+    file_path = Path(path or _state_file("analysis_results"))
+    _dump_records(analysis_results, file_path)
+    if path is None:
+        _remove_stale_state_files("analysis_results", file_path)
     return file_path
 
 
+async def save_analysis_results_async(analysis_results: list[dict[str, Any]], path: str | Path | None = None) -> Path:
+    """save_analysis_results on a worker thread, so async stages don't block the event loop."""
+    return await asyncio.to_thread(save_analysis_results, analysis_results, path)
+
+
 def load_analysis_results(path: str | Path | None = None) -> list[dict[str, Any]]:
-    """Load analysis_results from JSON."""
-    file_path = path or _get_state_dir() / "analysis_results.json"
-    file_path = Path(file_path)
+    """Load analysis_results from msgpack, JSONL or legacy JSON."""
+    file_path = Path(path or _find_state_file("analysis_results"))
     if not file_path.is_file():
         raise FileNotFoundError(f"State file not found: {file_path}. Run stage 'analyze' first.")
-    with open(file_path, encoding="utf-8") as f:
-        return json.load(f)
+    return _load_records(file_path)
 
 
 def save_ranked_results(ranked_results: list[dict[str, Any]], path: str | Path | None = None) -> Path:
-    """Save ranked_results to JSON. Returns path used."""
-    dir_path = _get_state_dir()
-    file_path = path or dir_path / "ranked_results.json"
-    file_path = Path(file_path)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(ranked_results, f, default=_default_serializer, indent=2, ensure_ascii=False)
+    """Stream ranked_results to zstd msgpack (or JSONL with PIPELINE_STATE_FORMAT=json). Returns path used."""
+    file_path = Path(path or _state_file("ranked_results"))
+    _dump_records(ranked_results, file_path)
+    if path is None:
+        _remove_stale_state_files("ranked_results", file_path)
     return file_path
 
 
 def load_ranked_results(path: str | Path | None = None) -> list[dict[str, Any]]:
-    """Load ranked_results from JSON."""
-    file_path = path or _get_state_dir() / "ranked_results.json"
-    file_path = Path(file_path)
+    """Load ranked_results from msgpack, JSONL or legacy JSON."""
+    file_path = Path(path or _find_state_file("ranked_results"))
     if not file_path.is_file():
         raise FileNotFoundError(f"State file not found: {file_path}. Run stage 'rank' first.")
-    with open(file_path, encoding="utf-8") as f:
-        return json.load(f)
+    return _load_records(file_path)
@@ -1,23 +1,63 @@
 # tools.py
 """Helper functions for yfinance, Tavily, and Google Sheets."""
 
+import asyncio
+import logging
 import os
+import threading
+from concurrent.futures import Future
 from datetime import datetime, timedelta
 from typing import Any
 
+import msgspec
+import numpy as np
 import yfinance as yf
 from dotenv import load_dotenv
 from langchain_core.tools import tool
 from langchain_tavily import TavilySearch
 
+from cache import PRICES_TTL, cache_get, cache_key, cache_set
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 # ---------------------------------------------------------------------------
 # yfinance: historical price and financial metrics
 # ---------------------------------------------------------------------------
 
 
+def _summarize_history(ticker: str, hist: Any, info: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Build the fetch_stock_data result (recent price stats + info) from an OHLCV history frame."""
+    if hist.empty:
+        return {"ticker": ticker, "error": "No history", "prices": None, "info": {}}
+
+    info = info or {}
+    # Reduce on the underlying arrays once instead of going through pandas indexing per stat
+    closes = hist["Close"].to_numpy(dtype=float)
+    highs = hist["High"].to_numpy(dtype=float)[-14:]
+    lows = hist["Low"].to_numpy(dtype=float)[-14:]
+    prices = {
+        "current": float(closes[-1]),
+        "high_14d": float(np.nanmax(highs)),
+        "low_14d": float(np.nanmin(lows)),
+        "volume_avg": float(np.nanmean(hist["Volume"].to_numpy(dtype=float))) if "Volume" in hist.columns else None,
+        # tz_localize(None) keeps the exchange-local date (UTC would shift e.g. Tokyo bars a day back)
+        "last_dates": np.datetime_as_string(hist.index[-5:].tz_localize(None).values, unit="D").tolist(),
+        "closes": closes[-14:],
+    }
+    return {
+        "ticker": ticker,
+        "prices": prices,
+        "info": {
+            "sector": info.get("sector"),
+            "industry": info.get("industry"),
+            "marketCap": info.get("marketCap"),
+        },
+    }
+
+
 @tool
 def fetch_stock_data(ticker: str, days_back: int = 30) -> dict[str, Any]:
     """
@@ -26,33 +66,97 @@ def fetch_stock_data(ticker: str, days_back: int = 30) -> dict[str, Any]:
     Returns OHLCV summary and recent price stats.
     """
     days_back = max(30, int(days_back))
+    key = cache_key("stock", ticker.upper(), days_back)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+    return _fetch_stock_data_once(ticker, days_back, key)
+
+
+# (ticker, days_back) -> Future of the fetch currently running for it
+_inflight: dict[tuple[str, int], Future] = {}
+_inflight_lock = threading.Lock()
+
+
+def _tolist(obj: Any) -> Any:
+    """to_builtins fallback for numpy arrays/scalars (e.g. price closes)."""
+    return obj.tolist()
+
+
+def _plain_copy(result: dict[str, Any]) -> dict[str, Any]:
+    """Fresh copy of a fetch result in plain Python types (closes as a list), the shape a cache hit returns."""
+    return msgspec.to_builtins(result, enc_hook=_tolist)
+
+
+def _fetch_stock_data_once(ticker: str, days_back: int, key: str) -> dict[str, Any]:
+    """
+    Run _fetch_stock_data and cache a successful result. Concurrent callers for the same
+    (ticker, days_back) wait for the fetch already in flight instead of hitting yfinance again;
+    each caller gets its own copy.
+    """
+    flight = (ticker.upper(), days_back)
+    with _inflight_lock:
+        future = _inflight.get(flight)
+        owner = future is None
+        if owner:
+            future = _inflight[flight] = Future()
+    if not owner:
+        return _plain_copy(future.result())
+
+    try:
+        result = _fetch_stock_data(ticker, days_back)
+        if not result.get("error"):
+            cache_set(key, result, PRICES_TTL)
+        future.set_result(result)
+        return _plain_copy(result)
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[flight]
+
+
+def _fetch_stock_data(ticker: str, days_back: int) -> dict[str, Any]:
+    """Uncached body of fetch_stock_data: history + info for one ticker (two yfinance requests)."""
     sym = yf.Ticker(ticker)
     end = datetime.now()
     start = end - timedelta(days=days_back)
     hist = sym.history(start=start, end=end)
     info = sym.info
+    return _summarize_history(ticker, hist, info)
 
-    if hist.empty:
-        return {"ticker": ticker, "error": "No history", "prices": None, "info": {}}
 
-    recent = hist.tail(14)
-    prices = {
-        "current": float(hist["Close"].iloc[-1]) if len(hist) else None,
-        "high_14d": float(recent["High"].max()) if len(recent) else None,
-        "low_14d": float(recent["Low"].min()) if len(recent) else None,
-        "volume_avg": float(hist["Volume"].mean()) if "Volume" in hist.columns else None,
-        "last_dates": hist.index.strftime("%Y-%m-%d").tolist()[-5:],
-        "closes": hist["Close"].tolist()[-14:],
-    }
-    return {
-        "ticker": ticker,
-        "prices": prices,
-        "info": {
-            "sector": info.get("sector"),
-            "industry": info.get("industry"),
-            "marketCap": info.get("marketCap"),
-        },
-    }
+def fetch_stock_data_batch(tickers: list[str], days_back: int = 30) -> dict[str, dict[str, Any]]:
+    """
+    Fetch price history for many tickers in one yf.download request.
+    Returns {ticker: <fetch_stock_data result>}. Sector/industry info is left empty
+    since it needs one extra request per ticker.
+    """
+    if not tickers:
+        return {}
+    days_back = max(30, int(days_back))
+    end = datetime.now()
+    start = end - timedelta(days=days_back)
+    df = yf.download(
+        tickers,
+        start=start,
+        end=end,
+        group_by="ticker",
+        auto_adjust=True,
+        threads=True,
+        progress=False,
+    )
+
+    results: dict[str, dict[str, Any]] = {}
+    for ticker in tickers:
+        # Multi-ticker downloads have (ticker, field) columns; rows are aligned across tickers
+        if df is None or df.empty or (df.columns.nlevels > 1 and ticker not in df.columns.get_level_values(0)):
+            results[ticker] = {"ticker": ticker, "error": "No history", "prices": None, "info": {}}
+            continue
+        hist = df[ticker] if df.columns.nlevels > 1 else df
+        results[ticker] = _summarize_history(ticker, hist.dropna(subset=["Close"]))
+    return results
 
 
 # ---------------------------------------------------------------------------
@@ -76,111 +180,134 @@ def get_tavily_tool(max_results: int = 5) -> TavilySearch:
     return _tavily_tool
 
 
-def search_news_and_macro(ticker: str, include_macro: bool = True) -> dict[str, Any]:
-    """
-    Use Tavily to fetch recent news for the ticker and optional macro/economic context.
-    Returns structured dict with 'news' and optionally 'macro' snippets.
-    """
-    import logging
+_MACRO_QUERY = "US economic macro data inflation Fed interest rates latest"
 
-    logger = logging.getLogger(__name__)
+# Network failures worth retrying; search_news_async raises these instead of returning a placeholder
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, OSError)
 
+
+def _tavily_or_error() -> tuple[TavilySearch | None, str | None]:
+    """Return (tool, None), or (None, error message) if the key is missing or init fails."""
     # Check if API key is set
     if not os.getenv("TAVILY_API_KEY"):
         error_msg = "TAVILY_API_KEY not set in environment"
         logger.error(error_msg)
-        return {"news": [f"Error: {error_msg}"], "macro": [f"Error: {error_msg}"]}
-
+        return None, error_msg
     try:
-        tavily = get_tavily_tool(max_results=5)
+        return get_tavily_tool(max_results=5), None
     except Exception as e:
         error_msg = f"Failed to initialize Tavily tool: {e}"
         logger.error(error_msg)
-        return {"news": [f"Error: {error_msg}"], "macro": [f"Error: {error_msg}"]}
+        return None, error_msg
 
-    out: dict[str, Any] = {"news": [], "macro": []}
 
-    # Stock-specific news
-    try:
-        news_result = tavily.invoke({"query": f"latest news {ticker} stock earnings revenue"})
-        logger.info(
-            f"Tavily news result for {ticker}: type={type(news_result)}, value={str(news_result)[:500]}"
-        )
+class _TavilyResponse(msgspec.Struct):
+    """The fields of a Tavily search response the pipeline reads; other keys are ignored."""
 
-        # Handle different response formats
-        if isinstance(news_result, list):
-            out["news"] = [r.get("content", str(r)) for r in news_result[:5] if r]
-        elif isinstance(news_result, dict):
-            # Check for error first
-            if "error" in news_result:
-                error = news_result["error"]
-                error_msg = str(error) if isinstance(error, Exception) else str(error)
-                logger.error(f"Tavily API error for {ticker}: {error_msg}")
-                out["news"] = [f"Tavily API error: {error_msg}"]
-            # Check for results array
-            elif "results" in news_result and isinstance(news_result["results"], list):
-                out["news"] = [
-                    r.get("content", r.get("raw_content", str(r)))
-                    for r in news_result["results"][:5]
-                    if r
-                ]
-                # Check for answer field
-                if "answer" in news_result and news_result["answer"]:
-                    out["news"].insert(0, news_result["answer"])
-            # Check if it's a direct content field
-            elif "content" in news_result:
-                out["news"] = [news_result["content"]]
-        elif isinstance(news_result, str):
-            # Sometimes Tavily returns a string directly
-            out["news"] = [news_result]
-
-        if not out["news"]:
-            logger.warning(
-                f"No news results returned from Tavily for {ticker}. Raw result: {news_result}"
-            )
+    results: list[Any] | None = None
+    answer: str | None = None
+    error: Any = None
+    content: str | None = None
+
+
+def _parse_tavily_result(result: Any, limit: int, label: str, reraise: tuple[type[Exception], ...] = ()) -> list[str]:
+    """
+    Turn a Tavily result (response dict, bare list of results, or plain string) into snippets:
+    the answer if present, then the content of up to limit results. API errors become one placeholder,
+    except reraise types: TavilySearch returns request exceptions as {"error": e} rather than raising.
+    """
+    if isinstance(result, str):
+        return [result]
+    if isinstance(result, list):
+        result = {"results": result}
+    if not isinstance(result, dict):
+        return []
+    resp = msgspec.convert(result, _TavilyResponse)
+    if isinstance(resp.error, reraise):
+        raise resp.error
+    if resp.error is not None:
+        logger.error(f"Tavily API error for {label}: {resp.error}")
+        return [f"Tavily API error: {resp.error}"]
+    if resp.results is not None:
+        snippets = [r.get("content", r.get("raw_content", str(r))) for r in resp.results[:limit] if r]
+        return [resp.answer, *snippets] if resp.answer else snippets
+    return [resp.content] if resp.content is not None else []
+
+
+async def _search_news(tavily: TavilySearch, ticker: str, reraise: tuple[type[Exception], ...] = ()) -> list[str]:
+    """Stock-specific news snippets for ticker (an error placeholder on failure, except for reraise types)."""
+    try:
+        news_result = await tavily.ainvoke({"query": f"latest news {ticker} stock earnings revenue"})
+        logger.info(f"Tavily news result for {ticker}: type={type(news_result)}, value={str(news_result)[:500]}")
+        news = _parse_tavily_result(news_result, 5, ticker, reraise)
+        if not news:
+            logger.warning(f"No news results returned from Tavily for {ticker}. Raw result: {news_result}")
+    except reraise:
+        raise
     except Exception as e:
         logger.exception(f"Tavily news search error for {ticker}: {e}")
-        out["news"] = [f"Tavily error: {e}"]
+        news = [f"Tavily error: {e}"]
+    return news
+
+
+async def _search_macro(tavily: TavilySearch) -> list[str]:
+    """US macro/economic context snippets (an error placeholder on failure)."""
+    try:
+        macro_result = await tavily.ainvoke({"query": _MACRO_QUERY})
+        logger.info(f"Tavily macro result: type={type(macro_result)}, value={str(macro_result)[:500]}")
+        macro = _parse_tavily_result(macro_result, 3, "macro")
+        if not macro:
+            logger.warning(f"No macro results returned from Tavily. Raw result: {macro_result}")
+    except Exception as e:
+        logger.exception(f"Tavily macro search error: {e}")
+        macro = [f"Macro search error: {e}"]
+    return macro
+
+
+def search_news_and_macro(ticker: str, include_macro: bool = True) -> dict[str, Any]:
+    """Sync wrapper around search_news_and_macro_async (for callers outside an event loop)."""
+    return asyncio.run(search_news_and_macro_async(ticker, include_macro=include_macro))
 
+
+async def search_news_and_macro_async(ticker: str, include_macro: bool = True) -> dict[str, Any]:
+    """
+    Use Tavily to fetch recent news for the ticker and optional macro/economic context.
+    Awaits Tavily's async client for both queries concurrently, so no worker thread is held
+    during the HTTP calls.
+    Returns structured dict with 'news' and optionally 'macro' snippets.
+    """
+    tavily, error_msg = _tavily_or_error()
+    if tavily is None:
+        return {"news": [f"Error: {error_msg}"], "macro": [f"Error: {error_msg}"]}
+
+    # News and macro are independent requests; overlap their round-trips
     if include_macro:
-        try:
-            macro_result = tavily.invoke(
-                {"query": "US economic macro data inflation Fed interest rates latest"}
-            )
-            logger.info(
-                f"Tavily macro result: type={type(macro_result)}, value={str(macro_result)[:500]}"
-            )
-
-            # Handle different response formats
-            if isinstance(macro_result, list):
-                out["macro"] = [r.get("content", str(r)) for r in macro_result[:3] if r]
-            elif isinstance(macro_result, dict):
-                # Check for error first
-                if "error" in macro_result:
-                    error = macro_result["error"]
-                    error_msg = str(error) if isinstance(error, Exception) else str(error)
-                    logger.error(f"Tavily API error for macro: {error_msg}")
-                    out["macro"] = [f"Tavily API error: {error_msg}"]
-                elif "results" in macro_result and isinstance(macro_result["results"], list):
-                    out["macro"] = [
-                        r.get("content", r.get("raw_content", str(r)))
-                        for r in macro_result["results"][:3]
-                        if r
-                    ]
-                    if "answer" in macro_result and macro_result["answer"]:
-                        out["macro"].insert(0, macro_result["answer"])
-                elif "content" in macro_result:
-                    out["macro"] = [macro_result["content"]]
-            elif isinstance(macro_result, str):
-                out["macro"] = [macro_result]
-
-            if not out["macro"]:
-                logger.warning(f"No macro results returned from Tavily. Raw result: {macro_result}")
-        except Exception as e:
-            logger.exception(f"Tavily macro search error: {e}")
-            out["macro"] = [f"Macro search error: {e}"]
-
-    return out
+        news, macro = await asyncio.gather(_search_news(tavily, ticker), _search_macro(tavily))
+    else:
+        news, macro = await _search_news(tavily, ticker), []
+    return {"news": news, "macro": macro}
+
+
+async def search_news_async(ticker: str) -> list[str]:
+    """
+    News snippets only, for callers that retry: TRANSIENT_ERRORS are raised rather than turned
+    into an error placeholder. Other failures still come back as a placeholder snippet.
+    """
+    tavily, error_msg = _tavily_or_error()
+    if tavily is None:
+        return [f"Error: {error_msg}"]
+    return await _search_news(tavily, ticker, reraise=TRANSIENT_ERRORS)
+
+
+async def search_macro_async() -> list[str]:
+    """
+    Macro/economic context snippets only. The query doesn't depend on the ticker, so batch
+    callers fetch it once and pair it with per-ticker news (search_news_async).
+    """
+    tavily, error_msg = _tavily_or_error()
+    if tavily is None:
+        return [f"Error: {error_msg}"]
+    return await _search_macro(tavily)
 
 
 # ---------------------------------------------------------------------------
@@ -207,6 +334,32 @@ def get_sheets_client():
     return gspread.authorize(creds)
 
 
+def _batch_write(sheet: Any, worksheet: Any, ranges: list[tuple[str, list[list[Any]]]]) -> None:
+    """Write several A1 ranges of worksheet in a single spreadsheets.values.batchUpdate request."""
+    from gspread.utils import absolute_range_name
+
+    sheet.values_batch_update(
+        {
+            "valueInputOption": "RAW",
+            "data": [{"range": absolute_range_name(worksheet.title, a1), "values": values} for a1, values in ranges],
+        }
+    )
+
+
+def _to_sheet_rows(rows: list[dict[str, Any]]) -> list[list[Any]]:
+    """Project result dicts onto the sheet columns (date, ticker, % change, reason); accepts either key style."""
+    # .get defaults rather than `or`, so a 0.0 prediction isn't blanked
+    return [
+        [
+            r.get("date", ""),
+            r.get("ticker", r.get("stock ticker", "")),
+            r.get("predicted_change_pct", r.get("% change in stock price", "")),
+            r.get("reason", ""),
+        ]
+        for r in rows
+    ]
+
+
 def write_results_to_new_sheet(
     sheet_name: str,
     rows: list[dict[str, Any]],
@@ -214,6 +367,7 @@ def write_results_to_new_sheet(
 ) -> str:
     """
     Create a new Google Sheet and write analysis results to it.
+    Header and data rows go out in one batchUpdate (create + write = two API calls).
     Returns the sheet ID of the created sheet.
     """
     if columns is None:
@@ -224,23 +378,10 @@ def write_results_to_new_sheet(
     sheet = client.create(sheet_name)
     worksheet = sheet.sheet1
 
-    # Write header row
-    worksheet.update("A1:D1", [columns])
-
-    # Write all data rows
-    row_data = []
-    for r in rows:
-        row_data.append(
-            [
-                r.get("date", ""),
-                r.get("ticker", r.get("stock ticker", "")),
-                r.get("predicted_change_pct", r.get("% change in stock price", "")),
-                r.get("reason", ""),
-            ]
-        )
+    row_data = _to_sheet_rows(rows)
 
-    if row_data:
-        worksheet.update(f"A2:D{len(row_data) + 1}", row_data)
+    # Header row plus all data rows as one contiguous range
+    _batch_write(sheet, worksheet, [(f"A1:D{len(row_data) + 1}", [columns, *row_data])])
 
     return sheet.id
 
@@ -253,6 +394,7 @@ def append_results_to_sheet(
     """
     Append analysis results to a Google Sheet.
     columns: [date, stock ticker, % change in stock price, reason]
+    Rows go out in one values.append call; the header is rewritten first only if missing/stale.
     Returns number of rows appended.
     """
     if columns is None:
@@ -264,24 +406,12 @@ def append_results_to_sheet(
         sheet = client.open(sheet_name_or_id)
     worksheet = sheet.sheet1
 
-    # Ensure header row
-    existing = worksheet.get_all_values()
-    if not existing or existing[0] != columns:
-        worksheet.update("A1:D1", [columns])
-        existing = worksheet.get_all_values()
-
-    row_data = []
-    for r in rows:
-        row_data.append(
-            [
-                r.get("date", ""),
-                r.get("ticker", r.get("stock ticker", "")),
-                r.get("predicted_change_pct", r.get("% change in stock price", "")),
-                r.get("reason", ""),
-            ]
-        )
-    if not row_data:
-        return 0
-    next_row = len(existing) + 1 if existing else 2
-    worksheet.update(f"A{next_row}:D{next_row + len(row_data) - 1}", row_data)
+    # Ensure header row (only written when missing/stale); reads row 1 only, not the whole sheet
+    if worksheet.row_values(1) != columns:
+        _batch_write(sheet, worksheet, [("A1:D1", [columns])])
+
+    row_data = _to_sheet_rows(rows)
+    # values.append finds the end of the table server-side, so no row index is tracked here
+    if row_data:
+        worksheet.append_rows(row_data, value_input_option="RAW", table_range="A1")
     return len(row_data)